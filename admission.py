@@ -0,0 +1,321 @@
+import os
+import time
+import uuid
+import threading
+from collections import deque
+from flask import Blueprint, jsonify, request, session, url_for
+from models import data_store, Registration
+from utils import login_required, send_notification
+
+admission_bp = Blueprint('admission', __name__)
+
+# Admission rate per event and per worker process (tokens per second / burst size)
+ADMISSION_RATE = float(os.environ.get('ADMISSION_RATE', '20'))
+ADMISSION_BURST = int(os.environ.get('ADMISSION_BURST', '50'))
+# Seconds an admitted ticket stays valid, and how long a queued ticket may go unpolled
+ADMISSION_TTL = int(os.environ.get('ADMISSION_TTL', '120'))
+QUEUE_POLL_TIMEOUT = int(os.environ.get('QUEUE_POLL_TIMEOUT', '60'))
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class AdmissionQueue:
+    """Virtual queue that admits students to an event's registration at a smoothed rate.
+
+    Students ask for a ticket; while the event's token bucket has tokens and
+    nobody is waiting the ticket is admitted immediately, otherwise it joins a
+    FIFO queue that drains as tokens refill. Polling a ticket only touches this
+    in-memory structure, never the DataStore.
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._queues = {}
+        self._tickets = {}
+        self._user_tickets = {}
+        self._admitted = deque()
+
+    def request(self, event_id, user_id):
+        """Return a ticket (dict) for the user, admitted or queued"""
+        with self._lock:
+            ticket = self._tickets.get(self._user_tickets.get((event_id, user_id)))
+            if ticket and ticket['state'] == 'admitted' and self._expired(ticket):
+                # Admission lapsed unused; drop it and queue the student again
+                self._forget(ticket, 'expired')
+                ticket = None
+            if ticket and ticket['state'] in ('queued', 'admitted'):
+                self._touch(ticket)
+                return dict(ticket, position=self._position(ticket))
+
+            queue = self._queues.setdefault(event_id, deque())
+            ticket = {
+                'id': uuid.uuid4().hex,
+                'event_id': event_id,
+                'user_id': user_id,
+                'state': 'queued',
+                'seq': queue[-1]['seq'] + 1 if queue else 0,
+                'polled_at': time.monotonic(),
+                'admitted_at': None
+            }
+            self._tickets[ticket['id']] = ticket
+            self._user_tickets[(event_id, user_id)] = ticket['id']
+            queue.append(ticket)
+            self._advance(event_id)
+            return dict(ticket, position=self._position(ticket))
+
+    def status(self, ticket_id):
+        """Refresh and return a ticket, or None if it is unknown"""
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if ticket is None:
+                return None
+            self._touch(ticket)
+            self._advance(ticket['event_id'])
+            return dict(ticket, position=self._position(ticket))
+
+    def consume(self, ticket_id, event_id, user_id):
+        """Use an admitted ticket; returns False if it is not valid for this user"""
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if (ticket is None or ticket['state'] != 'admitted' or ticket['event_id'] != event_id
+                    or ticket['user_id'] != user_id or self._expired(ticket)):
+                return False
+            self._forget(ticket, 'used')
+            return True
+
+    def _bucket(self, event_id):
+        bucket = self._buckets.get(event_id)
+        if bucket is None:
+            bucket = self._buckets[event_id] = TokenBucket(self.rate, self.burst)
+        return bucket
+
+    def _advance(self, event_id):
+        """Admit queued tickets from the head of the queue while tokens allow"""
+        queue = self._queues.get(event_id)
+        bucket = self._bucket(event_id)
+        now = time.monotonic()
+        while queue:
+            head = queue[0]
+            if now - head['polled_at'] > QUEUE_POLL_TIMEOUT:
+                # Abandoned (tab closed); drop it without spending a token
+                queue.popleft()
+                self._forget(head, 'expired')
+                continue
+            if not bucket.try_acquire():
+                break
+            queue.popleft()
+            head['state'] = 'admitted'
+            head['admitted_at'] = now
+            self._admitted.append(head)
+        self._expire_admitted()
+
+    def _expire_admitted(self):
+        # Tickets are admitted in time order, so expired ones sit at the left
+        while self._admitted and (self._admitted[0]['state'] != 'admitted'
+                                  or self._expired(self._admitted[0])):
+            ticket = self._admitted.popleft()
+            if ticket['state'] == 'admitted':
+                self._forget(ticket, 'expired')
+
+    def _expired(self, ticket):
+        return time.monotonic() - ticket['admitted_at'] > ADMISSION_TTL
+
+    def _position(self, ticket):
+        if ticket['state'] != 'queued':
+            return 0
+        queue = self._queues.get(ticket['event_id'])
+        return ticket['seq'] - queue[0]['seq'] + 1 if queue else 0
+
+    def _touch(self, ticket):
+        ticket['polled_at'] = time.monotonic()
+
+    def _forget(self, ticket, state):
+        ticket['state'] = state
+        self._tickets.pop(ticket['id'], None)
+        self._user_tickets.pop((ticket['event_id'], ticket['user_id']), None)
+
+
+admission_queue = AdmissionQueue(ADMISSION_RATE, ADMISSION_BURST)
+
+# Serializes the capacity check and the write that fills the seat
+_registration_lock = threading.Lock()
+
+
+def _create_registration(event_id, user_id):
+    registration = Registration(user_id, event_id)
+    reg_data = {
+        'id': registration.id,
+        'user_id': registration.user_id,
+        'event_id': registration.event_id,
+        'registered_at': registration.registered_at,
+        'attended': registration.attended,
+        'qr_code': registration.qr_code
+    }
+    event = data_store.events[event_id]
+    event['current_attendees'] = data_store.count_event_registrations(event_id) + 1
+    data_store.add_registration(registration.id, reg_data)
+    return reg_data
+
+
+def _user_registration(event_id, user_id):
+    for registration in data_store.get_user_registrations(user_id):
+        if registration['event_id'] == event_id:
+            return registration
+    return None
+
+
+def _fill_from_waitlist(event_id):
+    """Give free seats to waitlisted students in order; returns their new registrations"""
+    event = data_store.events.get(event_id)
+    promoted = []
+    if event is None:
+        return promoted
+    max_attendees = event.get('max_attendees')
+    while not max_attendees or data_store.count_event_registrations(event_id) < int(max_attendees):
+        user_id = data_store.pop_waitlist(event_id)
+        if user_id is None:
+            break
+        if _user_registration(event_id, user_id) is None:
+            promoted.append(_create_registration(event_id, user_id))
+    return promoted
+
+
+def _notify_promoted(event_id, registrations, skip_user_id=None):
+    event = data_store.events.get(event_id)
+    for registration in registrations:
+        if event and registration['user_id'] != skip_user_id:
+            send_notification(registration['user_id'], 'Registration Confirmed',
+                              f"A seat opened up and you are now registered for {event['title']}.",
+                              'success')
+
+
+def register_for_event(event_id, user_id):
+    """Register a user, or waitlist them when the event is full.
+
+    Seats freed up (e.g. by a capacity increase) go to waitlisted students
+    before anyone new. Returns a (status, value) pair: ('registered',
+    registration), ('waitlisted', position) or ('already_registered',
+    registration).
+    """
+    with _registration_lock:
+        registration = _user_registration(event_id, user_id)
+        if registration is not None:
+            return 'already_registered', registration
+
+        promoted = _fill_from_waitlist(event_id)
+        registration = next((r for r in promoted if r['user_id'] == user_id), None)
+        if registration is not None:
+            result = 'registered', registration
+        else:
+            event = data_store.events[event_id]
+            max_attendees = event.get('max_attendees')
+            if max_attendees and data_store.count_event_registrations(event_id) >= int(max_attendees):
+                result = 'waitlisted', data_store.add_to_waitlist(event_id, user_id)
+            else:
+                # A registered student must never also be waiting for a seat
+                data_store.remove_from_waitlist(event_id, user_id)
+                result = 'registered', _create_registration(event_id, user_id)
+
+    _notify_promoted(event_id, promoted, skip_user_id=user_id)
+    return result
+
+
+def cancel_registration(reg_id):
+    """Cancel a registration and promote waitlisted students into the free seats.
+
+    Returns the ids of the promoted users, or None if the registration does not exist.
+    """
+    with _registration_lock:
+        registration = data_store.registrations.get(reg_id)
+        if registration is None:
+            return None
+        event_id = registration['event_id']
+        data_store.delete_registration(reg_id)
+
+        promoted = _fill_from_waitlist(event_id)
+        event = data_store.events.get(event_id)
+        if not promoted and event:
+            event['current_attendees'] = data_store.count_event_registrations(event_id)
+            data_store.save_data()
+
+    _notify_promoted(event_id, promoted)
+    return [r['user_id'] for r in promoted]
+
+
+def _ticket_response(ticket):
+    return {
+        'ticket': ticket['id'],
+        'state': ticket['state'],
+        'position': ticket['position'],
+        'status_url': url_for('admission.ticket_status', ticket_id=ticket['id'])
+    }
+
+
+@admission_bp.route('/<event_id>/enter', methods=['POST'])
+@login_required('student')
+def enter(event_id):
+    if event_id not in data_store.events:
+        return jsonify({'error': 'Event not found'}), 404
+    ticket = admission_queue.request(event_id, session['user_id'])
+    return jsonify(_ticket_response(ticket))
+
+
+@admission_bp.route('/status/<ticket_id>')
+def ticket_status(ticket_id):
+    # Polled frequently by queued students: session check only, no DataStore access
+    ticket = admission_queue.status(ticket_id)
+    if ticket is None or ticket['user_id'] != session.get('user_id'):
+        return jsonify({'state': 'expired'}), 404
+    return jsonify(_ticket_response(ticket))
+
+
+@admission_bp.route('/<event_id>/register', methods=['POST'])
+@login_required('student')
+def register(event_id):
+    if event_id not in data_store.events:
+        return jsonify({'error': 'Event not found'}), 404
+    ticket_id = request.form.get('ticket') or request.args.get('ticket')
+    if not admission_queue.consume(ticket_id, event_id, session['user_id']):
+        return jsonify({'error': 'Admission ticket is missing or expired'}), 409
+
+    status, value = register_for_event(event_id, session['user_id'])
+    if status == 'waitlisted':
+        return jsonify({'status': status, 'position': value})
+    return jsonify({'status': status, 'registration_id': value['id']})
+
+
+@admission_bp.route('/registrations/<reg_id>/cancel', methods=['POST'])
+@login_required('student')
+def cancel(reg_id):
+    registration = data_store.registrations.get(reg_id)
+    if registration is None or registration['user_id'] != session['user_id']:
+        return jsonify({'error': 'Registration not found'}), 404
+    cancel_registration(reg_id)
+    return jsonify({'status': 'cancelled'})
+
+
+@admission_bp.route('/<event_id>/waitlist/leave', methods=['POST'])
+@login_required('student')
+def leave_waitlist(event_id):
+    removed = data_store.remove_from_waitlist(event_id, session['user_id'])
+    return jsonify({'status': 'removed' if removed else 'not_waitlisted'})
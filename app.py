@@ -1,15 +1,22 @@
 import os
-import logging
-from flask import Flask, render_template, redirect, url_for, session
+from flask import Flask, render_template, redirect, url_for, session, request
 from werkzeug.middleware.proxy_fix import ProxyFix
 from flask_moment import Moment
-from datetime import datetime
+from logging_config import configure_logging, init_request_ids
+from templating import configure_templates
+from models import data_store
+from background import ensure_started
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Tells command-line tools that write the data file (bulk_import.py) that a
+# server is running
+data_store.hold_server_lock()
+
+# Configure logging (queued JSON records, levels from LOG_LEVEL / LOG_LEVELS)
+configure_logging()
 
 # Create Flask app
 app = Flask(__name__)
+init_request_ids(app)
 moment = Moment(app)    
 app.secret_key = os.environ.get("SESSION_SECRET", "dev-secret-key-change-in-production")
 app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)
@@ -23,23 +30,44 @@ from auth import auth_bp
 from student.routes import student_bp
 from organizer.routes import organizer_bp
 from admin.routes import admin_bp
+from profiling import profiling_bp, init_profiling
+from bulk_import import bulk_import_bp
+from admission import admission_bp
+from live_updates import live_bp
+from recommendations import recommendations_bp, recommended_events
+from calendar_feed import calendar_bp
 
 app.register_blueprint(auth_bp, url_prefix='/auth')
 app.register_blueprint(student_bp, url_prefix='/student')
 app.register_blueprint(organizer_bp, url_prefix='/organizer')
 app.register_blueprint(admin_bp, url_prefix='/admin')
+app.register_blueprint(profiling_bp, url_prefix='/admin/profiles')
+app.register_blueprint(bulk_import_bp, url_prefix='/admin/import')
+app.register_blueprint(admission_bp, url_prefix='/admission')
+app.register_blueprint(live_bp, url_prefix='/live')
+app.register_blueprint(recommendations_bp, url_prefix='/recommendations')
+app.register_blueprint(calendar_bp, url_prefix='/calendar')
+
+# "Events for you" lists for dashboards: {{ recommended_events(session.user_id) }}
+app.add_template_global(recommended_events)
+
+# Per-request profiling (on demand for admins, automatic for slow requests)
+init_profiling(app)
+
+# Template bytecode cache and memoized date formatting
+configure_templates(app)
+
+# Start this process's background threads if post_fork has not (e.g. the dev server)
+app.before_request(ensure_started)
+
+# Endpoints that must stay cheap and never re-read the data file
+NO_REFRESH_ENDPOINTS = {'static', 'admission.ticket_status', 'live.stream'}
 
-@app.template_filter('strftime')
-def datetime_filter(value, format='%B %d, %Y at %I:%M %p'):
-    """Template filter to safely format datetime objects"""
-    if isinstance(value, str):
-        try:
-            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
-        except:
-            return value
-    if isinstance(value, datetime):
-        return value.strftime(format)
-    return value
+# Pick up saves made by other processes
+@app.before_request
+def refresh_data_store():
+    if request.endpoint not in NO_REFRESH_ENDPOINTS:
+        data_store.refresh_if_changed()
 
 @app.route('/')
 def index():
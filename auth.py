@@ -58,13 +58,12 @@ def register():
                                  firebase_app_id=os.environ.get('FIREBASE_APP_ID'))
 
         # Check if email already exists
-        for uid, user in data_store.users.items():
-            if user['email'] == email:
-                flash('Email already registered', 'error')
-                return render_template('auth/register.html',
-                                     firebase_api_key=os.environ.get('FIREBASE_API_KEY'),
-                                     firebase_project_id=os.environ.get('FIREBASE_PROJECT_ID'),
-                                     firebase_app_id=os.environ.get('FIREBASE_APP_ID'))
+        if data_store.get_user_by_email(email):
+            flash('Email already registered', 'error')
+            return render_template('auth/register.html',
+                                 firebase_api_key=os.environ.get('FIREBASE_API_KEY'),
+                                 firebase_project_id=os.environ.get('FIREBASE_PROJECT_ID'),
+                                 firebase_app_id=os.environ.get('FIREBASE_APP_ID'))
 
         # Get role-specific fields
         register_number = None
@@ -184,10 +183,9 @@ def admin_register():
         return redirect(url_for('auth.admin_login'))
 
     # Check if email already exists
-    for uid, user in data_store.users.items():
-        if user['email'] == email:
-            flash('Email already registered', 'error')
-            return redirect(url_for('auth.admin_login'))
+    if data_store.get_user_by_email(email):
+        flash('Email already registered', 'error')
+        return redirect(url_for('auth.admin_login'))
 
     # Create new admin user
     user = User(full_name, email, generate_password_hash(password), 'admin', None, None, full_name)
@@ -0,0 +1,43 @@
+"""
+Per-process start-up of background threads and change feed subscriptions.
+
+Threads do not survive a fork, so a gunicorn worker forked from a preloaded
+master has to start its own. Subsystems register their start function here
+once; gunicorn's post_fork hook runs them in every worker, and the app runs
+any that have not run yet before each request (covering the development
+server and GUNICORN_PRELOAD=0, where the app is imported after the fork).
+"""
+
+import os
+import threading
+
+_lock = threading.Lock()
+_starters = []
+# Process that has run every registered start function
+_started_pid = None
+
+
+def on_process_start(start, now=False):
+    """Run `start()` once in every process; with `now`, also immediately in this one"""
+    global _started_pid
+    with _lock:
+        entry = {'start': start, 'pid': None}
+        _starters.append(entry)
+        _started_pid = None
+        if now:
+            entry['pid'] = os.getpid()
+            start()
+
+
+def ensure_started():
+    """Run the start functions that have not run in this process yet"""
+    global _started_pid
+    pid = os.getpid()
+    if _started_pid == pid:
+        return
+    with _lock:
+        for entry in _starters:
+            if entry['pid'] != pid:
+                entry['pid'] = pid
+                entry['start']()
+        _started_pid = pid
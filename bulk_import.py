@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Bulk student import for semester onboarding.
+
+Streams a CSV with the columns full_name, email, register_number and
+department, skips rows whose email is already registered, hashes the
+initial passwords across all cores and adds every new student with a
+single save.
+
+Usage: python bulk_import.py students.csv [--password INITIAL] [--workers N]
+       (only while the web server is stopped; otherwise upload the CSV at
+       /admin/import/students)
+"""
+
+import os
+import csv
+import sys
+import uuid
+import argparse
+import logging
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from flask import Blueprint, request, jsonify, url_for
+from werkzeug.security import generate_password_hash
+from models import data_store, normalize_email, User
+from utils import login_required
+
+logger = logging.getLogger(__name__)
+
+bulk_import_bp = Blueprint('bulk_import', __name__)
+
+REQUIRED_COLUMNS = ('full_name', 'email', 'register_number', 'department')
+BATCH_SIZE = 1000
+
+# Imports started from the admin endpoint, by job id (kept for the life of the process)
+import_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def _validate_row(row, seen_emails):
+    """Return an error message for a bad row, or None if it can be imported"""
+    missing = [column for column in REQUIRED_COLUMNS if not (row.get(column) or '').strip()]
+    if missing:
+        return f"Missing {', '.join(missing)}"
+    email = normalize_email(row['email'])
+    if '@' not in email:
+        return 'Invalid email address'
+    if email in seen_emails:
+        return 'Duplicate email in file'
+    if data_store.get_user_by_email(email):
+        return 'Email already registered'
+    return None
+
+
+def _build_user(row, password_hash):
+    full_name = row['full_name'].strip()
+    user = User(full_name, row['email'].strip(), password_hash, 'student',
+                row['register_number'].strip(), row['department'].strip(), full_name)
+    return {
+        'id': user.id,
+        'username': user.username,
+        'email': user.email,
+        'password_hash': user.password_hash,
+        'role': user.role,
+        'created_at': user.created_at,
+        'is_active': user.is_active,
+        'full_name': user.full_name,
+        'register_number': user.register_number,
+        'department': user.department
+    }
+
+
+def import_students(stream, initial_password=None, workers=None):
+    """Import students from a CSV text stream.
+
+    This is a generator: it yields a progress event after every batch of
+    rows (with the errors found in that batch) and a final summary event.
+    Each student's initial password is ``initial_password`` or, when not
+    given, their register number.
+    """
+    reader = csv.DictReader(stream)
+    missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"CSV is missing required columns: {', '.join(missing)}")
+
+    new_users = {}
+    # Line number and email of each new user, to report users add_users skips
+    sources = {}
+    seen_emails = set()
+    processed = 0
+    error_count = 0
+
+    workers = workers or os.cpu_count() or 1
+    # Hashing processes come from a fork server rather than forking this
+    # (possibly multi-threaded) process, which could copy held locks
+    mp_context = multiprocessing.get_context('forkserver')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+        batch = []
+        errors = []
+
+        def flush():
+            passwords = [initial_password or row['register_number'].strip() for _, row in batch]
+            chunksize = max(1, len(batch) // (workers * 4))
+            hashes = executor.map(generate_password_hash, passwords, chunksize=chunksize)
+            for (line_number, row), password_hash in zip(batch, hashes):
+                user_data = _build_user(row, password_hash)
+                new_users[user_data['id']] = user_data
+                sources[user_data['id']] = (line_number, row.get('email'))
+            batch.clear()
+
+        # Row 1 is the header, so data rows start at line 2
+        for line_number, row in enumerate(reader, start=2):
+            processed += 1
+            error = _validate_row(row, seen_emails)
+            if error:
+                errors.append({'row': line_number, 'email': row.get('email'), 'error': error})
+            else:
+                seen_emails.add(normalize_email(row['email']))
+                batch.append((line_number, row))
+
+            if processed % BATCH_SIZE == 0:
+                flush()
+                error_count += len(errors)
+                yield {'type': 'progress', 'processed': processed,
+                       'imported': len(new_users), 'errors': errors}
+                errors = []
+
+        flush()
+        error_count += len(errors)
+        if errors or processed % BATCH_SIZE:
+            yield {'type': 'progress', 'processed': processed,
+                   'imported': len(new_users), 'errors': errors}
+
+    # Emails are checked again at commit time: accounts may have been
+    # registered while the file was being processed
+    skipped = data_store.add_users(new_users) if new_users else []
+    errors = [{'row': sources[user_id][0], 'email': sources[user_id][1], 'error': 'Email already registered'}
+              for user_id in skipped]
+    imported = len(new_users) - len(skipped)
+    error_count += len(errors)
+    logger.info("Bulk student import finished",
+                extra={'processed': processed, 'imported': imported, 'failed': error_count})
+    yield {'type': 'done', 'processed': processed, 'imported': imported, 'failed': error_count,
+           'errors': errors}
+
+
+def _run_import_job(job, path, initial_password):
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for event in import_students(f, initial_password=initial_password):
+                with _jobs_lock:
+                    job['errors'].extend(event.get('errors', []))
+                    job['processed'] = event['processed']
+                    job['imported'] = event['imported']
+                    if event['type'] == 'done':
+                        job['state'] = 'done'
+    except Exception as e:
+        logger.exception("Bulk student import failed", extra={'job_id': job['id']})
+        with _jobs_lock:
+            job['state'] = 'failed'
+            job['error'] = str(e)
+    finally:
+        os.remove(path)
+
+
+@bulk_import_bp.route('/students', methods=['POST'])
+@login_required('admin')
+def import_students_upload():
+    """Start a background import of the uploaded CSV and return its job id"""
+    upload = request.files.get('file')
+    if not upload or not upload.filename:
+        return jsonify({'error': 'No CSV file uploaded'}), 400
+
+    # Spool the upload to disk so the import can outlive this request
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    with os.fdopen(fd, 'wb') as f:
+        upload.save(f)
+
+    job = {'id': uuid.uuid4().hex, 'state': 'running', 'filename': upload.filename,
+           'processed': 0, 'imported': 0, 'errors': [], 'error': None}
+    with _jobs_lock:
+        import_jobs[job['id']] = job
+    threading.Thread(target=_run_import_job, name=f"import-{job['id']}", daemon=True,
+                     args=(job, path, request.form.get('initial_password') or None)).start()
+
+    status_url = url_for('bulk_import.import_status', job_id=job['id'])
+    return jsonify({'job': job['id'], 'status_url': status_url}), 202
+
+
+@bulk_import_bp.route('/students/<job_id>')
+@login_required('admin')
+def import_status(job_id):
+    """Progress of an import; ?errors_from=N returns only row errors after the first N"""
+    errors_from = request.args.get('errors_from', 0, type=int)
+    with _jobs_lock:
+        job = import_jobs.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Unknown import job'}), 404
+        status = dict(job, errors=job['errors'][errors_from:], failed=len(job['errors']))
+    return jsonify(status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import students from a CSV file')
+    parser.add_argument('csv_file', help='CSV with full_name, email, register_number, department')
+    parser.add_argument('--password', help='initial password for every student (default: register number)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='password hashing processes')
+    args = parser.parse_args()
+
+    # The server keeps its own copy of the data in memory and would write it
+    # back over the imported students
+    if data_store.server_is_running():
+        print("❌ The web server is using the data file; stop it first or upload the CSV "
+              "at /admin/import/students", file=sys.stderr)
+        sys.exit(1)
+
+    with open(args.csv_file, newline='', encoding='utf-8-sig') as f:
+        try:
+            for event in import_students(f, initial_password=args.password, workers=args.workers):
+                for error in event.get('errors', []):
+                    print(f"  Row {error['row']} ({error['email']}): {error['error']}", file=sys.stderr)
+                if event['type'] == 'progress':
+                    print(f"Processed {event['processed']} rows, {event['imported']} imported", file=sys.stderr)
+                else:
+                    print(f"✅ Imported {event['imported']} of {event['processed']} students "
+                          f"({event['failed']} rows failed)")
+        except ValueError as e:
+            print(f"❌ {e}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,257 @@
+import os
+import hmac
+import queue
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import timezone
+from flask import Blueprint, Response, current_app, jsonify, request, session, url_for, abort
+from models import data_store
+from change_feed import feed, ALL_TOPICS
+from utils import login_required, parse_datetime
+from background import on_process_start
+
+calendar_bp = Blueprint('calendar', __name__)
+
+CALENDAR_CACHE_SIZE = int(os.environ.get('CALENDAR_CACHE_SIZE', '5000'))
+# Feeds with more events than this are streamed while they are generated
+STREAM_THRESHOLD = 200
+# Calendar apps poll every few minutes; let them reuse the feed in between
+CALENDAR_MAX_AGE = 300
+
+
+def feed_token(user_id):
+    """Secret per-user token for the feed URL (calendar apps cannot send our session cookie)"""
+    key = current_app.secret_key.encode()
+    return hmac.new(key, f"calendar:{user_id}".encode(), hashlib.sha256).hexdigest()[:32]
+
+
+def _ics_escape(text):
+    return (str(text or '').replace('\\', '\\\\').replace(';', '\\;')
+            .replace(',', '\\,').replace('\r\n', '\\n').replace('\n', '\\n'))
+
+
+def _ics_datetime(value):
+    """DATE-TIME value: UTC ("Z" form) for aware datetimes, floating local time otherwise"""
+    value = parse_datetime(value)
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    return value.strftime('%Y%m%dT%H%M%S')
+
+
+def _ics_utc(value):
+    """DATE-TIME value in UTC, as DTSTAMP requires (naive values are server local time)"""
+    value = parse_datetime(value)
+    if value is None:
+        return None
+    return value.astimezone(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def _fold(line):
+    """Fold a content line at 75 octets as RFC 5545 requires"""
+    encoded = line.encode('utf-8')
+    if len(encoded) <= 75:
+        return line + '\r\n'
+    parts = []
+    while len(encoded) > 75:
+        cut = 75 if not parts else 74
+        # Never split a multi-byte character
+        while cut and (encoded[cut] & 0xC0) == 0x80:
+            cut -= 1
+        parts.append(encoded[:cut].decode('utf-8'))
+        encoded = encoded[cut:]
+    parts.append(encoded.decode('utf-8'))
+    return '\r\n '.join(parts) + '\r\n'
+
+
+def _feed_entries(user_id):
+    """(registration, event) pairs in the user's feed, oldest event first"""
+    entries = []
+    for registration in data_store.get_user_registrations(user_id):
+        event = data_store.events.get(registration['event_id'])
+        if event and _ics_datetime(event.get('start_date')):
+            entries.append((registration, event))
+    entries.sort(key=lambda entry: _ics_datetime(entry[1]['start_date']))
+    return entries
+
+
+def _fingerprint(entries):
+    """Content version of a feed, computed without rendering it (used as the ETag)"""
+    digest = hashlib.sha1()
+    for registration, event in entries:
+        digest.update(repr((registration['id'], event['id'], event.get('title'), event.get('venue'),
+                            event.get('description'), str(event.get('start_date')),
+                            str(event.get('end_date')), event.get('status'))).encode())
+    return digest.hexdigest()
+
+
+def _render_event(registration, event):
+    lines = [
+        'BEGIN:VEVENT',
+        f"UID:{registration['id']}@smvec-events",
+        f"DTSTAMP:{_ics_utc(registration.get('registered_at')) or _ics_utc(event['start_date'])}",
+        f"DTSTART:{_ics_datetime(event['start_date'])}",
+    ]
+    end = _ics_datetime(event.get('end_date'))
+    if end:
+        lines.append(f"DTEND:{end}")
+    lines.append(f"SUMMARY:{_ics_escape(event.get('title'))}")
+    if event.get('venue'):
+        lines.append(f"LOCATION:{_ics_escape(event['venue'])}")
+    if event.get('description'):
+        lines.append(f"DESCRIPTION:{_ics_escape(event['description'])}")
+    lines.append('STATUS:CANCELLED' if event.get('status') == 'rejected' else 'STATUS:CONFIRMED')
+    lines.append('END:VEVENT')
+    return ''.join(_fold(line) for line in lines)
+
+
+CALENDAR_HEADER = ''.join(_fold(line) for line in [
+    'BEGIN:VCALENDAR',
+    'VERSION:2.0',
+    'PRODID:-//SMVEC//Campus Events//EN',
+    'CALSCALE:GREGORIAN',
+    'X-WR-CALNAME:SMVEC Campus Events',
+])
+CALENDAR_FOOTER = _fold('END:VCALENDAR')
+
+
+class CalendarCache:
+    """LRU cache of rendered feeds, invalidated from the change feed.
+
+    Pending changes are applied at the start of every lookup, so no
+    background thread is needed. Every invalidation bumps a version, and a
+    feed built from an older version is not stored.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+        self._generation = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._subscription = None
+
+    def start(self):
+        """Start listening for changes in this process"""
+        with self._lock:
+            # Only the kinds that invalidate feeds: this inbox is drained
+            # by feed requests, so seat and notification traffic would fill it
+            self._subscription = feed.subscribe([ALL_TOPICS], maxsize=10000,
+                                                kinds={'registration', 'event', 'reloaded'})
+            self._clear()
+
+    def _apply_changes(self):
+        if self._subscription is None:
+            return
+        if self._subscription.dropped:
+            self._subscription.dropped = 0
+            self._clear()
+        while True:
+            try:
+                message = self._subscription.queue.get_nowait()
+            except queue.Empty:
+                return
+            if message['kind'] == 'registration':
+                self._invalidate(message['topic'].split(':', 1)[1])
+            elif message['kind'] == 'event':
+                for registration in data_store.get_event_registrations(message['data']['event_id']):
+                    self._invalidate(registration['user_id'])
+            elif message['kind'] == 'reloaded':
+                self._clear()
+
+    def _invalidate(self, user_id):
+        self._entries.pop(user_id, None)
+        self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+    def _clear(self):
+        self._entries.clear()
+        self._versions.clear()
+        self._generation += 1
+
+    def version(self, user_id):
+        """Token to pass to put(), taken before the feed is built"""
+        with self._lock:
+            self._apply_changes()
+            return self._generation, self._versions.get(user_id, 0)
+
+    def get(self, user_id):
+        with self._lock:
+            self._apply_changes()
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                self._entries.move_to_end(user_id)
+            return entry
+
+    def put(self, user_id, version, etag, body):
+        with self._lock:
+            self._apply_changes()
+            if self._subscription is None or version != (self._generation, self._versions.get(user_id, 0)):
+                # Not listening for changes yet, or the user's feed changed
+                # while this one was being built
+                return
+            self._entries[user_id] = (etag, body)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+
+calendar_cache = CalendarCache(CALENDAR_CACHE_SIZE)
+on_process_start(calendar_cache.start)
+
+
+def _calendar_response(body, etag):
+    response = Response(body, mimetype='text/calendar')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = f'private, max-age={CALENDAR_MAX_AGE}'
+    return response
+
+
+@calendar_bp.route('/<user_id>/<token>.ics')
+def user_feed(user_id, token):
+    # Compared as bytes: compare_digest raises TypeError for non-ASCII strings
+    if user_id not in data_store.users \
+            or not hmac.compare_digest(token.encode(), feed_token(user_id).encode()):
+        abort(404)
+
+    cached = calendar_cache.get(user_id)
+    if cached is not None:
+        etag, body = cached
+        if request.if_none_match.contains(etag):
+            return _calendar_response('', etag).make_conditional(request)
+        return _calendar_response(body, etag)
+
+    version = calendar_cache.version(user_id)
+    entries = _feed_entries(user_id)
+    etag = _fingerprint(entries)
+    if request.if_none_match.contains(etag):
+        # The client already has this version (e.g. served by another worker)
+        return _calendar_response('', etag).make_conditional(request)
+
+    if len(entries) <= STREAM_THRESHOLD:
+        body = CALENDAR_HEADER + ''.join(_render_event(r, e) for r, e in entries) + CALENDAR_FOOTER
+        calendar_cache.put(user_id, version, etag, body)
+        return _calendar_response(body, etag)
+
+    def generate():
+        chunks = [CALENDAR_HEADER]
+        yield CALENDAR_HEADER
+        for registration, event in entries:
+            chunk = _render_event(registration, event)
+            chunks.append(chunk)
+            yield chunk
+        yield CALENDAR_FOOTER
+        chunks.append(CALENDAR_FOOTER)
+        calendar_cache.put(user_id, version, etag, ''.join(chunks))
+
+    return _calendar_response(generate(), etag)
+
+
+@calendar_bp.route('/subscribe')
+@login_required()
+def subscribe():
+    """Return the logged-in user's private feed URL"""
+    user_id = session['user_id']
+    url = url_for('calendar.user_feed', user_id=user_id, token=feed_token(user_id), _external=True)
+    return jsonify({'url': url, 'webcal_url': url.replace('https://', 'webcal://').replace('http://', 'webcal://')})
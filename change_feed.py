@@ -0,0 +1,76 @@
+import queue
+import threading
+
+# Subscribers to this topic receive every published change
+ALL_TOPICS = '*'
+# Store-wide changes (e.g. a reload from disk)
+STORE_TOPIC = 'store'
+
+
+class Subscription:
+    """A subscriber's bounded inbox of changes for a set of topics"""
+
+    def __init__(self, topics, maxsize, kinds=None):
+        self.topics = set(topics)
+        self.kinds = set(kinds) if kinds is not None else None
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.dropped = 0
+
+    def get(self, timeout=None):
+        """Return the next change, raising queue.Empty after `timeout` seconds"""
+        return self.queue.get(timeout=timeout)
+
+
+class ChangeFeed:
+    """In-process publish/subscribe hub for DataStore changes.
+
+    Publishing never blocks: a subscriber whose inbox is full simply misses
+    the change (and its `dropped` counter goes up).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers = {}
+
+    def subscribe(self, topics, maxsize=100, kinds=None):
+        """Subscribe to changes on `topics`, optionally only those of the given `kinds`"""
+        subscription = Subscription(topics, maxsize, kinds)
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers.setdefault(topic, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                subscribers = self._subscribers.get(topic)
+                if subscribers:
+                    subscribers.discard(subscription)
+                    if not subscribers:
+                        del self._subscribers[topic]
+
+    def publish(self, topic, kind, data):
+        """Deliver a change to everyone subscribed to `topic` or to ALL_TOPICS"""
+        if not self._subscribers:
+            return
+        message = {'topic': topic, 'kind': kind, 'data': data}
+        with self._lock:
+            targets = self._subscribers.get(topic, set()) | self._subscribers.get(ALL_TOPICS, set())
+        for subscription in targets:
+            if subscription.kinds is not None and kind not in subscription.kinds:
+                continue
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.dropped += 1
+
+
+feed = ChangeFeed()
+
+
+def user_topic(user_id):
+    return f"user:{user_id}"
+
+
+def event_topic(event_id):
+    return f"event:{event_id}"
@@ -0,0 +1,41 @@
+"""
+Gunicorn configuration for the SMVEC Campus Events Management System
+
+With GUNICORN_PRELOAD=1 (the default) the master imports the app once,
+loads the DataStore and compiles the templates before forking, so a
+restarted worker is serving again without re-importing everything.
+Set GUNICORN_PRELOAD=0 when running with --reload during development.
+
+Only one worker is supported: every save rewrites the whole JSON data file
+from the worker's in-memory copy, so concurrent workers would overwrite
+each other's saves. Several workers (and sharing the preloaded pages
+between them) have to wait until every DataStore write merges with the
+file under its lock, as add_users already does.
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+# One worker only; see the note above about the JSON DataStore
+workers = 1
+# Threaded workers so long-lived /live/stream connections do not pin a whole process
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    """Warm caches in the master so a (re)started worker inherits them"""
+    if not preload_app:
+        return
+    from app import app
+    from templating import warm_templates
+    warm_templates(app)
+    server.log.info("Preloaded app and warmed templates in master")
+
+
+def post_fork(server, worker):
+    # Start the worker's own background threads (log writer, recommendation
+    # job, ...), which the fork did not copy
+    from background import ensure_started
+    ensure_started()
@@ -0,0 +1,80 @@
+import os
+import json
+import time
+import queue
+import threading
+from flask import Blueprint, Response, request, session, stream_with_context
+from models import data_store
+from change_feed import feed, user_topic, event_topic, STORE_TOPIC
+from utils import login_required
+
+live_bp = Blueprint('live', __name__)
+
+# Seconds between keep-alive comments, and before a stream is closed so the
+# browser's EventSource reconnects (freeing the worker thread in between)
+HEARTBEAT_INTERVAL = int(os.environ.get('SSE_HEARTBEAT_INTERVAL', '15'))
+STREAM_MAX_SECONDS = int(os.environ.get('SSE_STREAM_MAX_SECONDS', '300'))
+MAX_WATCHED_EVENTS = 50
+
+# Each open stream holds a worker thread, so only this many may stream at once
+# (keep it well below gunicorn's `threads`). Clients over the limit get a
+# one-off snapshot and are told to reconnect later, i.e. they fall back to
+# slow polling instead of starving page requests.
+MAX_STREAMS = int(os.environ.get('SSE_MAX_STREAMS', '8'))
+FALLBACK_RETRY_MS = 30000
+_stream_slots = threading.BoundedSemaphore(MAX_STREAMS)
+
+# Change kinds forwarded to browsers
+STREAMED_KINDS = {'notification', 'seats'}
+
+
+def _sse(kind, data):
+    return f"event: {kind}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+@live_bp.route('/stream')
+@login_required()
+def stream():
+    """Server-Sent Events stream of the user's notifications and seat counts.
+
+    Seat counts are sent for the events listed in ?events=id1,id2 (for
+    example the cards on the current page), starting with a snapshot.
+    """
+    user_id = session['user_id']
+    event_ids = [e for e in request.args.get('events', '').split(',') if e][:MAX_WATCHED_EVENTS]
+    topics = [user_topic(user_id), STORE_TOPIC] + [event_topic(e) for e in event_ids]
+
+    def snapshot():
+        return [_sse('seats', data_store.seat_counts(e)) for e in event_ids if e in data_store.events]
+
+    def generate():
+        # Everything that needs releasing is acquired inside the generator, so a
+        # client that disconnects before the first chunk leaks nothing
+        if not _stream_slots.acquire(blocking=False):
+            yield f"retry: {FALLBACK_RETRY_MS}\n\n"
+            yield from snapshot()
+            return
+        subscription = None
+        try:
+            subscription = feed.subscribe(topics)
+            deadline = time.monotonic() + STREAM_MAX_SECONDS
+            yield "retry: 3000\n\n"
+            yield from snapshot()
+            while time.monotonic() < deadline:
+                try:
+                    message = subscription.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    yield ": keep-alive\n\n"
+                    continue
+                if message['kind'] == 'reloaded':
+                    # Changes saved by another process are not published here
+                    yield from snapshot()
+                elif message['kind'] in STREAMED_KINDS:
+                    yield _sse(message['kind'], message['data'])
+        finally:
+            if subscription is not None:
+                feed.unsubscribe(subscription)
+            _stream_slots.release()
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -0,0 +1,168 @@
+import os
+import sys
+import copy
+import json
+import uuid
+import queue
+import random
+import atexit
+import logging
+import logging.handlers
+from datetime import datetime, timezone
+from background import on_process_start
+
+# Logging configuration
+#   LOG_LEVEL  - default level for the root logger (INFO)
+#   LOG_LEVELS - per-module overrides, e.g. "models=WARNING,werkzeug=INFO"
+DEFAULT_LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+MODULE_LOG_LEVELS = os.environ.get('LOG_LEVELS', '')
+
+# Attributes every LogRecord has; anything else was passed through `extra`
+_RESERVED_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Format log records as one JSON object per line"""
+
+    def format(self, record):
+        entry = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'request_id': getattr(record, 'request_id', None),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED_ATTRS and key not in entry and key != 'sample_rate':
+                entry[key] = value
+        if record.exc_info:
+            entry['exc_info'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exc_info'] = record.exc_text
+        if record.stack_info:
+            entry['stack_info'] = record.stack_info
+        return json.dumps(entry, default=str)
+
+
+class RequestIdFilter(logging.Filter):
+    """Attach the current request id (if any) to every record"""
+
+    def filter(self, record):
+        if not hasattr(record, 'request_id'):
+            record.request_id = current_request_id()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Drop a share of high-volume records.
+
+    Callers opt in per event with ``extra={'sample_rate': 0.1}``; warnings
+    and errors are never sampled.
+    """
+
+    def filter(self, record):
+        rate = getattr(record, 'sample_rate', None)
+        if rate is None or record.levelno >= logging.WARNING:
+            return True
+        return random.random() < rate
+
+
+class StructuredQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps the traceback out of the message.
+
+    The stock QueueHandler folds the traceback into ``msg`` and clears
+    ``exc_info``; here it is rendered to ``exc_text`` so the JSON formatter
+    can emit it as its own field.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+def current_request_id():
+    """Return the id of the request being served, or None outside a request"""
+    try:
+        from flask import g, has_request_context
+    except ImportError:
+        return None
+    if has_request_context():
+        return g.get('request_id')
+    return None
+
+
+def _parse_module_levels(spec):
+    levels = {}
+    for item in spec.split(','):
+        if '=' in item:
+            name, level = item.split('=', 1)
+            levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def start_listener():
+    """Start the background thread that writes queued records to stdout"""
+    global _listener
+    root = logging.getLogger()
+    queue_handler = next((h for h in root.handlers if isinstance(h, StructuredQueueHandler)), None)
+    if queue_handler is None:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+    _listener = logging.handlers.QueueListener(queue_handler.queue, stream_handler,
+                                               respect_handler_level=False)
+    _listener.start()
+
+
+def stop_listener():
+    """Flush pending records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def configure_logging():
+    """Route all logging through a queue so request threads never block on I/O"""
+    root = logging.getLogger()
+    if any(isinstance(h, StructuredQueueHandler) for h in root.handlers):
+        return
+
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    queue_handler = StructuredQueueHandler(queue.SimpleQueue())
+    queue_handler.addFilter(SamplingFilter())
+    queue_handler.addFilter(RequestIdFilter())
+    root.addHandler(queue_handler)
+    root.setLevel(DEFAULT_LOG_LEVEL.upper())
+
+    for name, level in _parse_module_levels(MODULE_LOG_LEVELS).items():
+        logging.getLogger(name).setLevel(level)
+
+    # Started here and again in every forked worker
+    on_process_start(start_listener, now=True)
+    atexit.register(stop_listener)
+
+
+def init_request_ids(app):
+    """Assign every request an id (honouring X-Request-ID) for log correlation"""
+    from flask import g, request
+
+    @app.before_request
+    def _assign_request_id():
+        g.request_id = request.headers.get('X-Request-ID') or uuid.uuid4().hex
+
+    @app.after_request
+    def _echo_request_id(response):
+        request_id = g.get('request_id')
+        if request_id:
+            response.headers['X-Request-ID'] = request_id
+        return response
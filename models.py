@@ -2,6 +2,28 @@ from datetime import datetime
 import uuid
 import json
 import os
+import time
+import fcntl
+import logging
+import threading
+from functools import wraps
+from contextlib import contextmanager
+from collections import OrderedDict
+from change_feed import feed, user_topic, event_topic, STORE_TOPIC
+
+logger = logging.getLogger(__name__)
+
+# save_data runs on every mutation; only log a sample of successful saves
+SAVE_LOG_SAMPLE_RATE = 0.1
+
+# Minimum seconds between checks for saves made by other processes
+REFRESH_INTERVAL = float(os.environ.get('DATASTORE_REFRESH_INTERVAL', '1.0'))
+# A refresh that changes more records than this publishes a single 'reloaded'
+# change instead of one change per record
+REFRESH_PUBLISH_LIMIT = 500
+
+# Collections that are merged record by record on refresh
+MERGED_COLLECTIONS = ('users', 'events', 'registrations', 'feedback', 'notifications')
 
 def convert_datetime_strings(obj):
     """Convert datetime strings back to datetime objects"""
@@ -20,6 +42,18 @@ def convert_datetime_strings(obj):
             convert_datetime_strings(item)
     return obj
 
+def synchronized(method):
+    """Run a DataStore method while holding the store's lock"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+def normalize_email(email):
+    """Canonical form of an email address used for lookups"""
+    return email.strip().lower()
+
 # Persistent storage using JSON files
 class DataStore:
     def __init__(self, data_file='data/datastore.json'):
@@ -35,9 +69,18 @@ class DataStore:
         self.registrations = {}
         self.feedback = {}
         self.notifications = {}
-
-        # Create data directory if it doesn't exist
-        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        self.waitlists = {}
+        self._users_by_email = {}
+        self._registrations_by_event = {}
+        self._registrations_by_user = {}
+        self._feedback_by_user = {}
+        self._loaded_mtime = None
+        self._last_refresh_check = 0.0
+        self._file_lock_depth = 0
+        self._server_lock_file = None
+        # Guards every read-modify-write, save and reload; code that changes
+        # the collections directly (outside these methods) should hold it too
+        self.lock = threading.RLock()
 
         # Load existing data or initialize with default admin
         self.load_data()
@@ -56,12 +99,15 @@ class DataStore:
                 'register_number': None,
                 'department': None
             }
+            self._index_user(self.users['admin'])
             self.save_data()
 
+    @synchronized
     def load_data(self):
         """Load data from JSON file"""
         if os.path.exists(self.data_file):
             try:
+                self._loaded_mtime = os.stat(self.data_file).st_mtime_ns
                 with open(self.data_file, 'r') as f:
                     data = json.load(f)
                     self.users = convert_datetime_strings(data.get('users', {}))
@@ -69,14 +115,241 @@ class DataStore:
                     self.registrations = convert_datetime_strings(data.get('registrations', {}))
                     self.notifications = convert_datetime_strings(data.get('notifications', {}))
                     self.feedback = convert_datetime_strings(data.get('feedback', {}))
+                    self.waitlists = {event_id: OrderedDict(queue)
+                                      for event_id, queue in data.get('waitlists', {}).items()}
             except (json.JSONDecodeError, FileNotFoundError):
                 self.initialize_default_data()
         else:
             self.initialize_default_data()
+        self._build_indexes()
+
+    def refresh_if_changed(self):
+        """Merge in records another process has saved since we last loaded or saved.
+
+        Checks at most once per REFRESH_INTERVAL, so an unchanged store costs a
+        clock read per request.
+        """
+        now = time.monotonic()
+        if now - self._last_refresh_check < REFRESH_INTERVAL:
+            return
+        self._last_refresh_check = now
+        self._reload_if_changed()
+
+    @synchronized
+    def _reload_if_changed(self):
+        try:
+            mtime = os.stat(self.data_file).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._loaded_mtime:
+            return
+        # Under the file lock so a save in progress is never read half-written
+        with self.file_lock():
+            try:
+                with open(self.data_file, 'r') as f:
+                    data = json.load(f)
+                self._loaded_mtime = os.stat(self.data_file).st_mtime_ns
+            except (OSError, json.JSONDecodeError):
+                logger.exception("Error reading changed data", extra={'data_file': self.data_file})
+                return
+        changes = self._merge(data)
+        logger.info("Merged data changed by another process",
+                    extra={'data_file': self.data_file, 'changed': len(changes)})
+        if len(changes) > REFRESH_PUBLISH_LIMIT:
+            # Anything derived from the old collections has to be rebuilt
+            feed.publish(STORE_TOPIC, 'reloaded', {'data_file': self.data_file})
+            return
+        for collection, key, old, new in changes:
+            self._publish_merged(collection, key, old, new)
+
+    def _merge(self, data):
+        """Apply the records of a freshly read data file that differ from ours.
+
+        Unchanged records keep their objects and the indexes are only updated
+        for the changed ones. Returns (collection, key, old, new) tuples.
+        """
+        changes = []
+        for collection in MERGED_COLLECTIONS:
+            current = getattr(self, collection)
+            fresh = data.get(collection, {})
+            for key in [key for key in current if key not in fresh]:
+                changes.append((collection, key, current.pop(key), None))
+            for key, record in fresh.items():
+                record = convert_datetime_strings(record)
+                old = current.get(key)
+                if old != record:
+                    current[key] = record
+                    changes.append((collection, key, old, record))
+        fresh_waitlists = data.get('waitlists', {})
+        for event_id in set(self.waitlists) | set(fresh_waitlists):
+            queue = OrderedDict(fresh_waitlists.get(event_id, {}))
+            if list(self.waitlists.get(event_id, {}).items()) != list(queue.items()):
+                old = self.waitlists.pop(event_id, None)
+                if queue:
+                    self.waitlists[event_id] = queue
+                changes.append(('waitlists', event_id, old, queue or None))
+
+        for collection, key, old, new in changes:
+            if collection == 'users':
+                if old:
+                    self._unindex_user(old)
+                if new:
+                    self._index_user(new)
+            elif collection == 'registrations':
+                if old:
+                    self._unindex_registration(old)
+                if new:
+                    self._index_registration(new)
+            elif collection == 'feedback':
+                if old:
+                    self._unindex_feedback(key, old)
+                if new:
+                    self._index_feedback(key, new)
+        return changes
+
+    def _publish_merged(self, collection, key, old, new):
+        action = 'deleted' if new is None else 'added' if old is None else 'updated'
+        if collection == 'registrations':
+            self._publish_registration(new or old, action)
+        elif collection == 'events':
+            feed.publish(event_topic(key), 'event', {'action': action, 'event_id': key})
+            self._publish_seats(key)
+        elif collection == 'feedback' and new:
+            feed.publish(user_topic(new['user_id']), 'feedback',
+                         {'feedback_id': key, 'event_id': new['event_id']})
+        elif collection == 'notifications' and new and old is None:
+            feed.publish(user_topic(new['user_id']), 'notification', new)
+        elif collection == 'waitlists':
+            self._publish_seats(key)
+
+    @contextmanager
+    def file_lock(self):
+        """Hold the exclusive lock that serializes writes to the data file across processes.
+
+        Re-entrant within this process; callers must hold `self.lock`.
+        """
+        if self._file_lock_depth:
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+            return
+        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        with open(f"{self.data_file}.lock", 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._file_lock_depth = 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth = 0
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def hold_server_lock(self):
+        """Mark the data file as in use by a running server, for the life of this process"""
+        if self._server_lock_file is None:
+            os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+            self._server_lock_file = open(f"{self.data_file}.server", 'a')
+            # Shared, so every worker (and a preloading master) can hold it at once
+            fcntl.flock(self._server_lock_file, fcntl.LOCK_SH)
+
+    def server_is_running(self):
+        """True while some process holds the server lock on the data file"""
+        os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+        with open(f"{self.data_file}.server", 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                return True
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+            return False
+
+    def _build_indexes(self):
+        """Rebuild the lookup indexes from the loaded collections"""
+        self._users_by_email = {}
+        for user in self.users.values():
+            self._index_user(user)
+        self._registrations_by_event = {}
+        self._registrations_by_user = {}
+        for registration in self.registrations.values():
+            self._index_registration(registration)
+        self._feedback_by_user = {}
+        for feedback_id, entry in self.feedback.items():
+            self._index_feedback(feedback_id, entry)
+
+    def _index_user(self, user_data):
+        email = user_data.get('email')
+        if email:
+            self._users_by_email[normalize_email(email)] = user_data['id']
+
+    def _unindex_user(self, user_data):
+        email = user_data.get('email')
+        if email and self._users_by_email.get(normalize_email(email)) == user_data['id']:
+            del self._users_by_email[normalize_email(email)]
+
+    def _index_registration(self, reg_data):
+        self._registrations_by_event.setdefault(reg_data['event_id'], set()).add(reg_data['id'])
+        self._registrations_by_user.setdefault(reg_data['user_id'], set()).add(reg_data['id'])
+
+    def _unindex_registration(self, reg_data):
+        self._registrations_by_event.get(reg_data['event_id'], set()).discard(reg_data['id'])
+        self._registrations_by_user.get(reg_data['user_id'], set()).discard(reg_data['id'])
+
+    def _index_feedback(self, feedback_id, feedback_data):
+        self._feedback_by_user.setdefault(feedback_data['user_id'], set()).add(feedback_id)
+
+    def _unindex_feedback(self, feedback_id, feedback_data):
+        self._feedback_by_user.get(feedback_data['user_id'], set()).discard(feedback_id)
+
+    @synchronized
+    def get_event_registrations(self, event_id):
+        """Return the registrations for an event without scanning"""
+        return [self.registrations[reg_id] for reg_id in self._registrations_by_event.get(event_id, ())]
+
+    @synchronized
+    def get_user_registrations(self, user_id):
+        """Return a user's registrations without scanning"""
+        return [self.registrations[reg_id] for reg_id in self._registrations_by_user.get(user_id, ())]
+
+    @synchronized
+    def get_user_feedback(self, user_id):
+        """Return a user's feedback without scanning"""
+        return [self.feedback[feedback_id] for feedback_id in self._feedback_by_user.get(user_id, ())]
+
+    @synchronized
+    def count_event_registrations(self, event_id):
+        """Number of registrations for an event"""
+        return len(self._registrations_by_event.get(event_id, ()))
+
+    @synchronized
+    def seat_counts(self, event_id):
+        """Current registration, capacity and waitlist numbers for an event"""
+        event = self.events.get(event_id) or {}
+        return {
+            'event_id': event_id,
+            'registered': self.count_event_registrations(event_id),
+            'max_attendees': event.get('max_attendees'),
+            'waitlisted': len(self.waitlists.get(event_id, ()))
+        }
 
+    def _publish_seats(self, event_id):
+        feed.publish(event_topic(event_id), 'seats', self.seat_counts(event_id))
+
+    def _publish_registration(self, reg_data, action):
+        feed.publish(user_topic(reg_data['user_id']), 'registration',
+                     {'action': action, 'registration_id': reg_data['id'], 'event_id': reg_data['event_id']})
+        self._publish_seats(reg_data['event_id'])
+
+    @synchronized
+    def get_user_by_email(self, email):
+        """Look up a user by email (case-insensitive) without scanning"""
+        user_id = self._users_by_email.get(normalize_email(email))
+        return self.users.get(user_id) if user_id else None
+
+    @synchronized
     def initialize_default_data(self):
         """Initialize with default data if file not found or corrupted"""
-        print("Initializing default data.")
+        logger.info("Initializing default data", extra={'data_file': self.data_file})
         self.users = {
             'admin': {
                 'id': 'admin',
@@ -95,9 +368,11 @@ class DataStore:
         self.registrations = {}
         self.feedback = {}
         self.notifications = {}
+        self.waitlists = {}
         self.save_data()
 
 
+    @synchronized
     def save_data(self):
         """Save data to JSON file"""
         try:
@@ -106,60 +381,150 @@ class DataStore:
                 'events': self.events,
                 'registrations': self.registrations,
                 'feedback': self.feedback,
-                'notifications': self.notifications
+                'notifications': self.notifications,
+                'waitlists': self.waitlists
             }
-            with open(self.data_file, 'w') as f:
-                json.dump(data, f, indent=2, default=str)
-            print(f"Data saved to {self.data_file}")
-        except Exception as e:
-            print(f"Error saving data: {e}")
+            # Create data directory if it doesn't exist
+            os.makedirs(os.path.dirname(self.data_file), exist_ok=True)
+            with self.file_lock():
+                with open(self.data_file, 'w') as f:
+                    json.dump(data, f, indent=2, default=str)
+                self._loaded_mtime = os.stat(self.data_file).st_mtime_ns
+            logger.info("Data saved", extra={'data_file': self.data_file, 'sample_rate': SAVE_LOG_SAMPLE_RATE})
+        except Exception:
+            logger.exception("Error saving data", extra={'data_file': self.data_file})
 
+    @synchronized
     def add_user(self, user_id, user_data):
         """Add a user and save data"""
         self.users[user_id] = user_data
+        self._index_user(user_data)
         self.save_data()
 
+    @synchronized
+    def add_users(self, users):
+        """Add many users (a dict of id -> data) with a single save.
+
+        Users saved by other processes are merged in first. Returns the ids of
+        the users skipped because their email is already registered.
+        """
+        with self.file_lock():
+            self._reload_if_changed()
+            skipped = []
+            for user_id, user_data in users.items():
+                email = user_data.get('email')
+                if email and normalize_email(email) in self._users_by_email:
+                    skipped.append(user_id)
+                    continue
+                self.users[user_id] = user_data
+                self._index_user(user_data)
+            if len(skipped) < len(users):
+                self.save_data()
+            return skipped
+
+    @synchronized
     def add_event(self, event_id, event_data):
         """Add an event and save data"""
         self.events[event_id] = event_data
         self.save_data()
+        feed.publish(event_topic(event_id), 'event', {'action': 'added', 'event_id': event_id})
 
+    @synchronized
     def add_registration(self, reg_id, reg_data):
         """Add a registration and save data"""
         self.registrations[reg_id] = reg_data
+        self._index_registration(reg_data)
         self.save_data()
+        self._publish_registration(reg_data, 'added')
+
+    @synchronized
+    def delete_registration(self, reg_id):
+        """Delete a registration and save data"""
+        if reg_id in self.registrations:
+            reg_data = self.registrations.pop(reg_id)
+            self._unindex_registration(reg_data)
+            self.save_data()
+            self._publish_registration(reg_data, 'deleted')
 
+    @synchronized
+    def add_to_waitlist(self, event_id, user_id):
+        """Append a user to an event's waitlist and return their position"""
+        queue = self.waitlists.setdefault(event_id, OrderedDict())
+        if user_id not in queue:
+            queue[user_id] = datetime.now().isoformat()
+            self.save_data()
+            self._publish_seats(event_id)
+        return list(queue).index(user_id) + 1
+
+    @synchronized
+    def remove_from_waitlist(self, event_id, user_id):
+        """Remove a user from an event's waitlist"""
+        queue = self.waitlists.get(event_id)
+        if queue and user_id in queue:
+            del queue[user_id]
+            self.save_data()
+            self._publish_seats(event_id)
+            return True
+        return False
+
+    @synchronized
+    def pop_waitlist(self, event_id):
+        """Remove and return the user at the head of an event's waitlist (no save)"""
+        queue = self.waitlists.get(event_id)
+        if not queue:
+            return None
+        user_id, _ = queue.popitem(last=False)
+        return user_id
+
+    @synchronized
     def add_feedback(self, feedback_id, feedback_data):
         """Add feedback and save data"""
         self.feedback[feedback_id] = feedback_data
+        self._index_feedback(feedback_id, feedback_data)
         self.save_data()
+        feed.publish(user_topic(feedback_data['user_id']), 'feedback',
+                     {'feedback_id': feedback_id, 'event_id': feedback_data['event_id']})
 
+    @synchronized
     def add_notification(self, notification_id, notification_data):
         """Add notification and save data"""
         self.notifications[notification_id] = notification_data
         self.save_data()
+        feed.publish(user_topic(notification_data['user_id']), 'notification', notification_data)
 
+    @synchronized
     def update_user(self, user_id, user_data):
         """Update a user and save data"""
+        if user_id in self.users:
+            self._unindex_user(self.users[user_id])
         self.users[user_id] = user_data
+        self._index_user(user_data)
         self.save_data()
 
+    @synchronized
     def update_event(self, event_id, event_data):
         """Update an event and save data"""
         self.events[event_id] = event_data
         self.save_data()
+        feed.publish(event_topic(event_id), 'event', {'action': 'updated', 'event_id': event_id})
+        self._publish_seats(event_id)
 
+    @synchronized
     def delete_user(self, user_id):
         """Delete a user and save data"""
         if user_id in self.users:
+            self._unindex_user(self.users[user_id])
             del self.users[user_id]
             self.save_data()
 
+    @synchronized
     def delete_event(self, event_id):
         """Delete an event and save data"""
         if event_id in self.events:
             del self.events[event_id]
+            self.waitlists.pop(event_id, None)
             self.save_data()
+            feed.publish(event_topic(event_id), 'event', {'action': 'deleted', 'event_id': event_id})
 
 data_store = DataStore()
 
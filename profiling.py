@@ -0,0 +1,187 @@
+import os
+import sys
+import time
+import threading
+import cProfile
+import logging
+from collections import Counter
+from datetime import datetime
+from flask import Blueprint, render_template, request, session, g, abort, send_from_directory
+from utils import login_required
+from background import on_process_start
+
+logger = logging.getLogger(__name__)
+
+profiling_bp = Blueprint('profiling', __name__)
+
+# Profiling configuration (all optional, profiling is off unless requested)
+PROFILE_DIR = os.environ.get(
+    'PROFILE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'profiles'))
+PROFILE_HEADER = 'X-Profile'
+PROFILE_QUERY_ARG = '__profile'
+SLOW_REQUEST_MS = float(os.environ.get('PROFILE_SLOW_MS', '0') or 0)
+SAMPLE_INTERVAL = float(os.environ.get('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000.0
+MAX_PROFILES = int(os.environ.get('PROFILE_MAX_FILES', '200'))
+
+
+class StackSampler:
+    """Background sampler that records stacks of threads serving watched requests"""
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._watched = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self._run, name='profile-sampler', daemon=True).start()
+
+    def watch(self):
+        """Start collecting samples for the current thread"""
+        samples = Counter()
+        with self._lock:
+            self._watched[threading.get_ident()] = samples
+        return samples
+
+    def unwatch(self):
+        """Stop collecting samples for the current thread"""
+        with self._lock:
+            return self._watched.pop(threading.get_ident(), None)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            with self._lock:
+                if not self._watched:
+                    continue
+                frames = sys._current_frames()
+                for thread_id, samples in self._watched.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        samples[_collapse_stack(frame)] += 1
+
+
+def _collapse_stack(frame):
+    """Render a frame chain as a collapsed stack line (root first)"""
+    parts = []
+    while frame is not None:
+        code = frame.f_code
+        parts.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(parts))
+
+
+sampler = StackSampler(SAMPLE_INTERVAL)
+
+
+def _profile_requested():
+    """Profiling on demand is only honoured for logged in administrators"""
+    if request.headers.get(PROFILE_HEADER) != '1' and request.args.get(PROFILE_QUERY_ARG) != '1':
+        return False
+    return session.get('user_role') == 'admin'
+
+
+def _profile_basename(elapsed_ms):
+    endpoint = (request.endpoint or 'unknown').replace('.', '-')
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S-%f')
+    return f"{stamp}_{endpoint}_{int(elapsed_ms)}ms"
+
+
+def _prune_profiles():
+    """Keep only the newest MAX_PROFILES files in the profile directory"""
+    files = sorted(os.listdir(PROFILE_DIR))
+    for name in files[:-MAX_PROFILES] if len(files) > MAX_PROFILES else []:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except OSError:
+            pass
+
+
+def _start_profiling():
+    g._profile_started = time.perf_counter()
+    if _profile_requested():
+        g._profiler = cProfile.Profile()
+        g._profiler.enable()
+    elif SLOW_REQUEST_MS > 0:
+        g._profile_samples = sampler.watch()
+
+
+def _finish_profiling(response):
+    started = g.pop('_profile_started', None)
+    if started is None:
+        return response
+    elapsed_ms = (time.perf_counter() - started) * 1000.0
+    profiler = g.pop('_profiler', None)
+    samples = None
+    if g.pop('_profile_samples', None) is not None:
+        samples = sampler.unwatch()
+
+    if profiler is not None:
+        profiler.disable()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(os.path.join(PROFILE_DIR, _profile_basename(elapsed_ms) + '.prof'))
+        _prune_profiles()
+    elif samples and elapsed_ms >= SLOW_REQUEST_MS:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        path = os.path.join(PROFILE_DIR, _profile_basename(elapsed_ms) + '.folded')
+        with open(path, 'w') as f:
+            f.write(f"# {request.method} {request.full_path} {elapsed_ms:.1f}ms\n")
+            for stack, count in samples.most_common():
+                f.write(f"{stack} {count}\n")
+        _prune_profiles()
+        logger.warning("Slow request captured", extra={'endpoint': request.endpoint,
+                                                        'elapsed_ms': round(elapsed_ms, 1),
+                                                        'profile': os.path.basename(path)})
+    return response
+
+
+def _abandon_profiling(exc):
+    """Make sure the sampler and profiler are released if the request failed"""
+    if g.pop('_profile_samples', None) is not None:
+        sampler.unwatch()
+    profiler = g.pop('_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+
+
+def init_profiling(app):
+    """Install the per-request profiling hooks on the app"""
+    app.before_request(_start_profiling)
+    app.after_request(_finish_profiling)
+    app.teardown_request(_abandon_profiling)
+    if SLOW_REQUEST_MS > 0:
+        on_process_start(sampler.start)
+
+
+def list_profiles():
+    """Return stored profiles, newest first"""
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    profiles = []
+    for name in os.listdir(PROFILE_DIR):
+        path = os.path.join(PROFILE_DIR, name)
+        stat = os.stat(path)
+        profiles.append({
+            'name': name,
+            'kind': 'cProfile' if name.endswith('.prof') else 'sampled',
+            'size': stat.st_size,
+            'created_at': datetime.fromtimestamp(stat.st_mtime)
+        })
+    profiles.sort(key=lambda x: x['name'], reverse=True)
+    return profiles
+
+
+@profiling_bp.route('/')
+@login_required('admin')
+def profiles():
+    return render_template('admin/profiles.html',
+                           profiles=list_profiles(),
+                           slow_request_ms=SLOW_REQUEST_MS)
+
+
+@profiling_bp.route('/<path:name>')
+@login_required('admin')
+def download_profile(name):
+    if not name.endswith(('.prof', '.folded')):
+        abort(404)
+    return send_from_directory(PROFILE_DIR, name, as_attachment=True)
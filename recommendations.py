@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+Precomputed "events for you" recommendations.
+
+Each student gets a category-affinity vector built from the categories of
+events they registered for and the categories they rated highly. Their
+department's vector (the sum of its students' vectors) and each event's
+popularity are blended in, and the top-N upcoming events are stored per user
+and per department. A background thread recomputes everything periodically
+and only the affected users whenever registrations or feedback change, so the
+dashboard read is a single dictionary lookup.
+
+Usage: python recommendations.py   (full recompute, writes data/recommendations.json)
+"""
+
+import os
+import json
+import time
+import heapq
+import queue
+import logging
+import threading
+from datetime import datetime
+from flask import Blueprint, jsonify, session
+from models import data_store
+from change_feed import feed, ALL_TOPICS
+from utils import login_required, parse_datetime
+from background import on_process_start
+
+logger = logging.getLogger(__name__)
+
+recommendations_bp = Blueprint('recommendations', __name__)
+
+RECOMMENDATIONS_FILE = os.environ.get(
+    'RECOMMENDATIONS_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'recommendations.json'))
+TOP_N = int(os.environ.get('RECOMMENDATION_TOP_N', '10'))
+# Seconds between full recomputes, and between incremental passes for changed users
+FULL_REFRESH_INTERVAL = int(os.environ.get('RECOMMENDATION_INTERVAL', '900'))
+INCREMENTAL_INTERVAL = 5
+# Event edits and store reloads need a full pass, but run at most one this often
+MIN_FULL_INTERVAL = int(os.environ.get('RECOMMENDATION_MIN_FULL_INTERVAL', '60'))
+
+# Scoring weights
+REGISTRATION_WEIGHT = 1.0
+HIGH_RATING = 4
+DEPARTMENT_WEIGHT = 0.5
+POPULARITY_WEIGHT = 0.2
+
+# Key of the popularity-only list used when nothing better is known
+ALL_DEPARTMENTS = '*'
+
+
+def _normalize(vector):
+    total = sum(vector)
+    return [v / total for v in vector] if total else vector
+
+
+class ScoringContext:
+    """Candidate events and category lookups shared by every ranking in one pass"""
+
+    def __init__(self, events):
+        now = datetime.now()
+        self.category_index = {}
+        for event in events:
+            category = event.get('category')
+            if category is not None and category not in self.category_index:
+                self.category_index[category] = len(self.category_index)
+
+        self.candidates = []
+        self.candidate_category = []
+        for event in events:
+            start = parse_datetime(event.get('start_date'))
+            if event.get('status') == 'approved' and event.get('category') in self.category_index \
+                    and (start is None or start.replace(tzinfo=None) >= now):
+                self.candidates.append(event['id'])
+                self.candidate_category.append(self.category_index[event['category']])
+
+        counts = [data_store.count_event_registrations(e) for e in self.candidates]
+        peak = max(counts, default=0) or 1
+        self.popularity = [POPULARITY_WEIGHT * c / peak for c in counts]
+
+        self.event_category = {e['id']: self.category_index.get(e.get('category')) for e in events}
+
+    def zero_vector(self):
+        return [0.0] * len(self.category_index)
+
+    def rank(self, affinity, exclude=()):
+        """Top-N candidate event ids for a category-affinity vector"""
+        scores = [affinity[c] + p for c, p in zip(self.candidate_category, self.popularity)]
+        ranked = heapq.nlargest(TOP_N + len(exclude), range(len(scores)), key=scores.__getitem__)
+        return [self.candidates[i] for i in ranked if self.candidates[i] not in exclude][:TOP_N]
+
+
+def _accumulate(vectors, key, ctx, event_id, weight):
+    category = ctx.event_category.get(event_id)
+    if category is None or not weight:
+        return
+    vector = vectors.get(key)
+    if vector is None:
+        vector = vectors[key] = ctx.zero_vector()
+    vector[category] += weight
+
+
+def _user_vectors(ctx, registrations, feedback, user_ids=None):
+    """Category-affinity vectors (and registered event ids) for the given users (or all)"""
+    vectors = {}
+    registered = {}
+    for registration in registrations:
+        user_id = registration['user_id']
+        if user_ids is None or user_id in user_ids:
+            _accumulate(vectors, user_id, ctx, registration['event_id'], REGISTRATION_WEIGHT)
+            registered.setdefault(user_id, set()).add(registration['event_id'])
+    for entry in feedback:
+        user_id = entry['user_id']
+        if (user_ids is None or user_id in user_ids) and int(entry.get('rating') or 0) >= HIGH_RATING:
+            _accumulate(vectors, user_id, ctx, entry['event_id'], int(entry['rating']) - HIGH_RATING + 1)
+    return vectors, registered
+
+
+class RecommendationEngine:
+    """Holds the precomputed recommendation lists and the job that refreshes them"""
+
+    def __init__(self, path):
+        self.path = path
+        self.by_user = {}
+        self.by_department = {}
+        self.computed_at = None
+        self._department_vectors = {}
+        self._lock = threading.Lock()
+        self._subscription = None
+
+    def load(self):
+        """Warm start from the last stored results"""
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.by_user = data.get('by_user', {})
+        self.by_department = data.get('by_department', {})
+        self.computed_at = data.get('computed_at')
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'computed_at': self.computed_at, 'by_user': self.by_user,
+                       'by_department': self.by_department}, f)
+        os.replace(tmp_path, self.path)
+
+    def compute_all(self):
+        """Recompute department and user lists from scratch"""
+        started = time.perf_counter()
+        users = list(data_store.users.values())
+        registrations = list(data_store.registrations.values())
+        ctx = ScoringContext(list(data_store.events.values()))
+        vectors, registered = _user_vectors(ctx, registrations, list(data_store.feedback.values()))
+
+        departments = {}
+        for user in users:
+            if user.get('role') == 'student':
+                department_vector = departments.setdefault(user.get('department') or '', ctx.zero_vector())
+                for i, value in enumerate(vectors.get(user['id'], ())):
+                    department_vector[i] += value
+        department_vectors = {d: _normalize(v) for d, v in departments.items()}
+
+        by_department = {d: ctx.rank(v) for d, v in department_vectors.items()}
+        by_department[ALL_DEPARTMENTS] = ctx.rank(ctx.zero_vector())
+        by_user = {}
+        for user in users:
+            if user.get('role') == 'student' and user['id'] in vectors:
+                by_user[user['id']] = self._rank_user(ctx, user, vectors[user['id']],
+                                                      registered.get(user['id'], set()),
+                                                      department_vectors)
+
+        with self._lock:
+            self.by_user = by_user
+            self.by_department = by_department
+            self._department_vectors = department_vectors
+            self.computed_at = datetime.now().isoformat()
+        self.save()
+        logger.info("Recommendations recomputed", extra={
+            'users': len(by_user), 'departments': len(by_department),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1)})
+
+    def compute_users(self, user_ids):
+        """Recompute the lists of a few users after their activity changed"""
+        registrations = [r for u in user_ids for r in data_store.get_user_registrations(u)]
+        ctx = ScoringContext(list(data_store.events.values()))
+        feedback = [f for u in user_ids for f in data_store.get_user_feedback(u)]
+        vectors, registered = _user_vectors(ctx, registrations, feedback, user_ids)
+        updates = {}
+        for user_id in user_ids:
+            user = data_store.users.get(user_id)
+            if user and user.get('role') == 'student' and user_id in vectors:
+                updates[user_id] = self._rank_user(ctx, user, vectors[user_id],
+                                                   registered.get(user_id, set()),
+                                                   self._department_vectors)
+        with self._lock:
+            for user_id in user_ids:
+                # Users without any history fall back to their department's list
+                self.by_user.pop(user_id, None)
+            self.by_user.update(updates)
+
+    def _rank_user(self, ctx, user, vector, registered, department_vectors):
+        department_vector = department_vectors.get(user.get('department') or '')
+        affinity = _normalize(vector)
+        if department_vector and len(department_vector) == len(affinity):
+            affinity = [a + DEPARTMENT_WEIGHT * d for a, d in zip(affinity, department_vector)]
+        return ctx.rank(affinity, exclude=registered)
+
+    def recommendations_for(self, user):
+        """Stored recommendation ids for a user, falling back to their department"""
+        return (self.by_user.get(user['id'])
+                or self.by_department.get(user.get('department') or '')
+                or self.by_department.get(ALL_DEPARTMENTS, []))
+
+    def start(self):
+        """Start the refresh job in this process"""
+        if not self.computed_at:
+            self.load()
+        self._subscription = feed.subscribe([ALL_TOPICS], maxsize=10000,
+                                            kinds={'registration', 'feedback', 'event', 'reloaded'})
+        threading.Thread(target=self._run, name='recommendations', daemon=True).start()
+
+    def _run(self):
+        # Stored results serve reads until the first full pass has finished
+        last_full = None
+        full_requested = False
+        while True:
+            dirty = set()
+            deadline = time.monotonic() + INCREMENTAL_INTERVAL
+            while time.monotonic() < deadline:
+                try:
+                    message = self._subscription.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if message['kind'] in ('registration', 'feedback'):
+                    dirty.add(message['topic'].split(':', 1)[1])
+                elif message['kind'] in ('event', 'reloaded'):
+                    full_requested = True
+            if self._subscription.dropped:
+                self._subscription.dropped = 0
+                full_requested = True
+            since_full = None if last_full is None else time.monotonic() - last_full
+            try:
+                if since_full is None or since_full >= FULL_REFRESH_INTERVAL \
+                        or (full_requested and since_full >= MIN_FULL_INTERVAL):
+                    self.compute_all()
+                    last_full = time.monotonic()
+                    full_requested = False
+                elif dirty:
+                    self.compute_users(dirty)
+            except Exception:
+                logger.exception("Recommendation refresh failed")
+
+
+engine = RecommendationEngine(RECOMMENDATIONS_FILE)
+on_process_start(engine.start)
+
+
+def recommended_events(user_id):
+    """Upcoming event records recommended for a user (for dashboards)"""
+    user = data_store.users.get(user_id)
+    if not user:
+        return []
+    return [data_store.events[e] for e in engine.recommendations_for(user) if e in data_store.events]
+
+
+@recommendations_bp.route('/')
+@login_required('student')
+def for_me():
+    events = recommended_events(session['user_id'])
+    return jsonify([{'id': e['id'], 'title': e.get('title'), 'category': e.get('category'),
+                     'venue': e.get('venue'), 'start_date': e.get('start_date')} for e in events])
+
+
+if __name__ == "__main__":
+    engine.compute_all()
+    print(f"✅ Recommendations computed for {len(engine.by_user)} students "
+          f"and {len(engine.by_department)} departments")
@@ -0,0 +1,55 @@
+import os
+from functools import lru_cache
+from datetime import datetime
+from jinja2 import FileSystemBytecodeCache
+
+# Compiled templates are shared by every worker on the host through this directory
+JINJA_CACHE_DIR = os.environ.get(
+    'JINJA_CACHE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'jinja_cache'))
+DATE_FORMAT_CACHE_SIZE = int(os.environ.get('DATE_FORMAT_CACHE_SIZE', '4096'))
+DEFAULT_DATE_FORMAT = '%B %d, %Y at %I:%M %p'
+
+
+@lru_cache(maxsize=DATE_FORMAT_CACHE_SIZE)
+def _format_datetime(value, tzinfo, format):
+    # `tzinfo` is only part of the cache key: aware datetimes for the same
+    # instant compare (and hash) equal even when their zones differ
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return value
+    if isinstance(value, datetime):
+        return value.strftime(format)
+    return value
+
+
+def datetime_filter(value, format=DEFAULT_DATE_FORMAT):
+    """Template filter to safely format datetime objects"""
+    try:
+        tzinfo = value.tzinfo if isinstance(value, datetime) else None
+        return _format_datetime(value, tzinfo, format)
+    except TypeError:
+        # Unhashable values cannot be memoized and are never dates anyway
+        return value
+
+
+class LazyBytecodeCache(FileSystemBytecodeCache):
+    """Bytecode cache that creates its directory on first write instead of at import"""
+
+    def dump_bytecode(self, bucket):
+        os.makedirs(self.directory, exist_ok=True)
+        super().dump_bytecode(bucket)
+
+
+def configure_templates(app):
+    """Install the template bytecode cache and the memoized date filters"""
+    app.jinja_env.bytecode_cache = LazyBytecodeCache(JINJA_CACHE_DIR)
+    app.add_template_filter(datetime_filter, 'strftime')
+
+
+def warm_templates(app):
+    """Compile every template so workers forked afterwards start with them compiled"""
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
@@ -1,13 +1,17 @@
 from functools import wraps
 from flask import session, redirect, url_for, flash
 from models import data_store, Notification
+from change_feed import feed, user_topic
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import os
-import qrcode
 import io
 import base64
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
 
 def login_required(role=None):
     def decorator(f):
@@ -35,7 +39,7 @@ def login_required(role=None):
 def send_notification(user_id, title, message, notification_type='info'):
     """Send in-app notification to user"""
     notification = Notification(user_id, title, message, notification_type)
-    data_store.notifications[notification.id] = {
+    notification_data = {
         'id': notification.id,
         'user_id': notification.user_id,
         'title': notification.title,
@@ -44,6 +48,9 @@ def send_notification(user_id, title, message, notification_type='info'):
         'read': notification.read,
         'created_at': notification.created_at
     }
+    with data_store.lock:
+        data_store.notifications[notification.id] = notification_data
+    feed.publish(user_topic(user_id), 'notification', notification_data)
     
     # Optional: Send email notification
     user = data_store.users.get(user_id)
@@ -56,13 +63,10 @@ def send_email(to_email, subject, message):
     # In production, configure with actual SMTP settings
     try:
         # Mock email sending - just log it
-        print(f"EMAIL SENT TO: {to_email}")
-        print(f"SUBJECT: {subject}")
-        print(f"MESSAGE: {message}")
-        print("-" * 50)
+        logger.info("Email sent", extra={'to_email': to_email, 'subject': subject, 'body': message})
         return True
-    except Exception as e:
-        print(f"Failed to send email: {e}")
+    except Exception:
+        logger.exception("Failed to send email", extra={'to_email': to_email})
         return False
 
 def generate_qr_code(text):
@@ -99,6 +103,15 @@ def format_datetime(dt):
     """Format datetime for display"""
     return dt.strftime('%B %d, %Y at %I:%M %p')
 
+def parse_datetime(value):
+    """Datetime from a datetime or ISO 8601 string, or None if it is neither"""
+    if isinstance(value, str):
+        try:
+            return datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    return value if isinstance(value, datetime) else None
+
 def get_user_notifications(user_id, limit=10):
     """Get recent notifications for user"""
     user_notifications = []